@@ -0,0 +1,157 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+# Durata di default (secondi) delle voci in cache dello schema
+SCHEMA_CACHE_TTL = 600
+
+# Timeout ODBC (secondi, 0 = nessuno) applicato alle connessioni prese dal pool
+# nel contesto corrente: SQL Server annulla l'istruzione allo scadere
+_query_timeout = ContextVar("query_timeout", default=0)
+
+# Cache dei metadati di schema condivisa nel processo:
+# (connection_string, chiave) -> (timestamp, valore)
+_schema_cache = {}
+
+
+def cached_schema(connection_string, key, loader, ttl_seconds=SCHEMA_CACHE_TTL):
+    """
+    Restituisce i metadati di schema dalla cache, ricaricandoli se scaduti
+
+    Args:
+        connection_string: Stringa di connessione del database
+        key: Chiave dei metadati (es. nome tabella)
+        loader: Funzione senza argomenti che legge i metadati dal database
+        ttl_seconds: Validita' della voce in cache in secondi
+    """
+    now = time.monotonic()
+    entry = _schema_cache.get((connection_string, key))
+    if entry is not None and now - entry[0] < ttl_seconds:
+        return entry[1]
+
+    value = loader()
+    _schema_cache[(connection_string, key)] = (now, value)
+    return value
+
+
+def invalidate_schema_cache(connection_string=None):
+    """Svuota la cache dello schema (solo per una connessione se specificata)"""
+    if connection_string is None:
+        _schema_cache.clear()
+        return
+
+    for cache_key in [k for k in _schema_cache if k[0] == connection_string]:
+        del _schema_cache[cache_key]
+
+
+def quote_identifier(name):
+    """Quota un identificatore T-SQL come QUOTENAME: [nome] con ] raddoppiato"""
+    return "[" + name.replace("]", "]]") + "]"
+
+
+def quote_table_name(table_name):
+    """Quota un nome tabella, eventualmente qualificato con lo schema (schema.tabella)"""
+    return ".".join(quote_identifier(part) for part in table_name.split("."))
+
+
+def create_sql_engine(connection_string, pool_size=10, max_overflow=20):
+    """
+    Crea l'engine SQLAlchemy per SQL Server
+
+    Le righe vengono lette in streaming dal result set di default ("firehose"):
+    pyodbc mantiene la row-array size a 1, quindi il driver ODBC non passa a un
+    cursore server con round-trip sp_cursorfetch.
+    Le connessioni restano aperte nel pool (niente handshake TCP/TLS/login per
+    query) e fast_executemany invia i parametri degli INSERT multipli in blocco.
+
+    Args:
+        connection_string: Stringa di connessione mssql+pyodbc
+        pool_size: Connessioni mantenute aperte nel pool
+        max_overflow: Connessioni aggiuntive consentite nei picchi
+    """
+    engine = create_engine(
+        connection_string,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_pre_ping=True,
+        fast_executemany=True,
+        execution_options={"stream_results": True}
+    )
+
+    @event.listens_for(engine, "checkout")
+    def _apply_query_timeout(dbapi_connection, connection_record, connection_proxy):
+        # pyodbc: Connection.timeout imposta SQL_ATTR_QUERY_TIMEOUT sulle istruzioni
+        dbapi_connection.timeout = _query_timeout.get()
+
+    return engine
+
+
+@contextmanager
+def query_timeout(seconds):
+    """
+    Applica un timeout ODBC alle query eseguite nel blocco
+
+    Allo scadere il driver annulla l'istruzione su SQL Server e solleva un
+    errore HYT00; la connessione torna libera nel pool.
+    """
+    token = _query_timeout.set(int(seconds))
+    try:
+        yield
+    finally:
+        _query_timeout.reset(token)
+
+
+class AsyncQueryRunner:
+    """Esecuzione asincrona delle query tramite AsyncEngine (driver aioodbc)"""
+
+    def __init__(self, connection_string, pool_size=5, max_overflow=10):
+        """
+        Args:
+            connection_string: Stringa di connessione mssql+pyodbc
+            pool_size: Connessioni mantenute aperte nel pool
+            max_overflow: Connessioni aggiuntive consentite nei picchi
+        """
+        self.engine = create_async_engine(
+            connection_string.replace("mssql+pyodbc", "mssql+aioodbc", 1),
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_pre_ping=True
+        )
+        self._latencies = deque(maxlen=100)
+        self.errors = 0
+
+    async def execute(self, query, params=None):
+        """Esegue una query e restituisce le righe come lista di tuple"""
+        start = time.perf_counter()
+        try:
+            async with self.engine.connect() as conn:
+                result = await conn.execute(text(query), params or {})
+                return [tuple(row) for row in result.fetchall()] if result.returns_rows else []
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self._latencies.append(time.perf_counter() - start)
+
+    async def run_sync(self, fn, *args):
+        """Esegue fn(connection, *args) su una connessione sincrona del pool asincrono"""
+        async with self.engine.connect() as conn:
+            return await conn.run_sync(fn, *args)
+
+    @property
+    def pool_health(self):
+        """Stato del pool e latenze delle ultime query"""
+        pool = self.engine.sync_engine.pool
+        latencies = sorted(self._latencies)
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "queries": len(latencies),
+            "errors": self.errors,
+            "avg_latency": sum(latencies) / len(latencies) if latencies else None,
+            "p95_latency": latencies[int(len(latencies) * 0.95)] if latencies else None,
+        }
@@ -0,0 +1,49 @@
+import re
+
+# Righe massime per "primi N di X": oltre, la domanda passa all'agente
+# invece di materializzare l'intero risultato in un'unica stringa
+FAST_PATH_MAX_ROWS = 1000
+
+# Punteggiatura finale ammessa dopo il template (es. "?")
+_END = r"\s*[?.!]*\s*"
+
+# Domande frequenti risolte con SQL parametrizzato, senza passare dall'agente.
+# I pattern devono corrispondere all'intera domanda: qualsiasi filtro o
+# ordinamento in piu' ("... hanno Status = 5", "... ordinati per X") non
+# corrisponde e la domanda passa all'agente.
+FAST_PATH_ROUTES = [
+    (
+        re.compile(
+            r"\s*quant[ei]\s+(?:righe|record)\s+"
+            r"(?:ha|contiene|ci\s+sono\s+nella|sono\s+nella|nella|in)\s+"
+            r"(?:la\s+)?tabella\s+(?P<table>\w+(?:\.\w+)*)" + _END,
+            re.I
+        ),
+        "SELECT COUNT(*) FROM {table}"
+    ),
+    (
+        re.compile(
+            r"\s*(?:mostra(?:mi)?\s+)?(?:i\s+)?primi\s+(?P<n>\d+)\s+"
+            r"(?:record\s+|righe\s+)?di\s+(?P<table>\w+(?:\.\w+)*)" + _END,
+            re.I
+        ),
+        "SELECT TOP {n} * FROM {table}"
+    ),
+]
+
+
+def match_fast_path(question):
+    """
+    Cerca un template che corrisponda all'intera domanda
+
+    Returns:
+        (template SQL, parametri) oppure None se la domanda va all'agente
+    """
+    for pattern, template in FAST_PATH_ROUTES:
+        match = pattern.fullmatch(question)
+        if match:
+            params = match.groupdict()
+            if "n" in params and int(params["n"]) > FAST_PATH_MAX_ROWS:
+                return None
+            return template, params
+    return None
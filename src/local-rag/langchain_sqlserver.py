@@ -1,14 +1,29 @@
 import os
+from urllib.parse import quote_plus
 from langchain_community.utilities import SQLDatabase
 from langchain.sql_database import SQLDatabaseChain
 from langchain.llms import OpenAI
+from langchain.embeddings import OpenAIEmbeddings
 from langchain_community.agent_toolkits import SQLDatabaseToolkit
 from langchain.agents import create_sql_agent
 from langchain.agents.agent_types import AgentType
 import pandas as pd
+from db_utils import SCHEMA_CACHE_TTL, AsyncQueryRunner, cached_schema, create_sql_engine, invalidate_schema_cache
+from query_cache import QueryCache
+
+try:
+    from adbc_driver_mssql import dbapi as adbc_mssql
+except ImportError:
+    adbc_mssql = None
+
+try:
+    import connectorx as cx
+except ImportError:
+    cx = None
 
 class SQLServerLangChain:
-    def __init__(self, server, database, username=None, password=None, use_windows_auth=True):
+    def __init__(self, server, database, username=None, password=None, use_windows_auth=True,
+                 schema_cache_ttl=SCHEMA_CACHE_TTL):
         """
         Inizializza la connessione a SQL Server
         
@@ -18,22 +33,54 @@ class SQLServerLangChain:
             username: Username (se non si usa autenticazione Windows)
             password: Password (se non si usa autenticazione Windows)
             use_windows_auth: True per usare autenticazione Windows
+            schema_cache_ttl: Secondi di validita' della cache dei metadati di schema
         """
+        self.schema_cache_ttl = schema_cache_ttl
+
         if use_windows_auth:
             self.connection_string = f"mssql+pyodbc://{server}/{database}?driver=ODBC+Driver+17+for+SQL+Server&trusted_connection=yes"
         else:
             self.connection_string = f"mssql+pyodbc://{username}:{password}@{server}/{database}?driver=ODBC+Driver+17+for+SQL+Server"
         
+        # Stringhe di connessione per la lettura colonnare senza pyodbc:
+        # formato connectorx e formato URI del driver ADBC (sqlserver://)
+        if use_windows_auth:
+            self.connection_string_cx = f"mssql://{server}/{database}?trusted_connection=true"
+            self.connection_uri_adbc = f"sqlserver://{server}?database={quote_plus(database)}"
+        else:
+            self.connection_string_cx = f"mssql://{username}:{password}@{server}/{database}"
+            self.connection_uri_adbc = (
+                f"sqlserver://{quote_plus(username)}:{quote_plus(password)}@{server}"
+                f"?database={quote_plus(database)}"
+            )
+        
         # Creare connessione database
-        self.db = SQLDatabase.from_uri(self.connection_string)
+        self.db = SQLDatabase(create_sql_engine(self.connection_string))
+        self.query_cache = None
+        self.cache_scope = None
+        self._async_runner = None
         
     def get_tables(self):
         """Restituisce lista delle tabelle disponibili"""
-        return self.db.get_table_names()
+        return cached_schema(
+            self.connection_string, "__tables__",
+            lambda: list(self.db.get_table_names()),
+            self.schema_cache_ttl
+        )
     
     def get_table_schema(self, table_name):
         """Restituisce schema di una tabella specifica"""
-        return self.db.get_table_info(table_names=[table_name])
+        return cached_schema(
+            self.connection_string, table_name,
+            lambda: self.db.get_table_info(table_names=[table_name]),
+            self.schema_cache_ttl
+        )
+    
+    def invalidate_schema_cache(self):
+        """Svuota la cache dello schema e le risposte in cache (da chiamare dopo modifiche DDL)"""
+        invalidate_schema_cache(self.connection_string)
+        if self.query_cache:
+            self.query_cache.clear_scope(self.cache_scope)
     
     def execute_query(self, query):
         """Esegue una query SQL diretta"""
@@ -43,10 +90,36 @@ class SQLServerLangChain:
         except Exception as e:
             return f"Errore nell'esecuzione della query: {str(e)}"
     
-    def setup_agent(self, openai_api_key):
+    @property
+    def async_runner(self):
+        """Esecutore asincrono delle query, creato al primo utilizzo"""
+        if self._async_runner is None:
+            self._async_runner = AsyncQueryRunner(self.connection_string)
+        return self._async_runner
+    
+    @property
+    def pool_health(self):
+        """Metriche del pool di connessioni asincrono"""
+        return self.async_runner.pool_health
+    
+    async def aexecute_query(self, query):
+        """Esegue una query SQL diretta senza bloccare l'event loop"""
+        try:
+            return await self.async_runner.execute(query)
+        except Exception as e:
+            return f"Errore nell'esecuzione della query: {str(e)}"
+    
+    def setup_agent(self, openai_api_key, use_cache=True, embedding_model="text-embedding-3-small"):
         """Configura l'agente SQL per query in linguaggio naturale"""
         llm = OpenAI(temperature=0, openai_api_key=openai_api_key)
         
+        # Cache delle risposte (match esatto + semantico)
+        if use_cache:
+            self.query_cache = QueryCache(
+                embeddings=OpenAIEmbeddings(model=embedding_model, openai_api_key=openai_api_key)
+            )
+            self.cache_scope = QueryCache.make_scope(llm.model_name, self.connection_string, embedding_model)
+        
         self.agent_executor = create_sql_agent(
             llm=llm,
             db=self.db,
@@ -60,17 +133,60 @@ class SQLServerLangChain:
             return "Errore: Agente non configurato. Usa setup_agent() prima."
         
         try:
+            if self.query_cache:
+                cached = self.query_cache.get(question, self.cache_scope)
+                if cached is not None:
+                    return cached
+            
             response = self.agent_executor.run(question)
+            
+            if self.query_cache:
+                self.query_cache.put(question, self.cache_scope, response)
             return response
         except Exception as e:
             return f"Errore nella query: {str(e)}"
     
-    def query_to_dataframe(self, query):
-        """Esegue query e restituisce risultati come DataFrame pandas"""
+    def _query_to_arrow_adbc(self, query):
+        """Esegue la query con il driver ADBC e restituisce una tabella Arrow"""
+        with adbc_mssql.connect(self.connection_uri_adbc) as conn:
+            with conn.cursor() as cur:
+                cur.execute(query)
+                return cur.fetch_arrow_table()
+    
+    def query_to_dataframe(self, query, chunksize=50_000, arrow_dtypes=False):
+        """
+        Esegue query e restituisce risultati come DataFrame pandas
+        
+        Args:
+            query: Query SQL da eseguire
+            chunksize: Righe per blocco nella lettura tramite pyodbc
+            arrow_dtypes: True per colonne pd.ArrowDtype (senza copia) con il driver ADBC
+        """
         try:
-            # Usa la connessione SQLAlchemy sottostante
+            # ADBC trasferisce i valori TDS direttamente in colonne Arrow tipizzate;
+            # in caso di errore si passa al metodo successivo
+            if adbc_mssql is not None:
+                try:
+                    table = self._query_to_arrow_adbc(query)
+                    return table.to_pandas(types_mapper=pd.ArrowDtype if arrow_dtypes else None)
+                except Exception as e:
+                    print(f"ADBC non utilizzabile, uso il metodo successivo: {str(e)}")
+            
+            # connectorx decodifica le colonne direttamente in buffer Arrow;
+            # in caso di errore (URI, autenticazione, tipi) si passa a pyodbc
+            if cx is not None:
+                try:
+                    return cx.read_sql(self.connection_string_cx, query, return_type="pandas")
+                except Exception as e:
+                    print(f"connectorx non utilizzabile, uso pyodbc: {str(e)}")
+            
+            # Altrimenti legge a blocchi tramite la connessione SQLAlchemy sottostante,
+            # senza bufferizzare l'intero result set in un'unica lista di righe
             engine = self.db._engine
-            df = pd.read_sql_query(query, engine)
+            chunks = list(pd.read_sql_query(query, engine, chunksize=chunksize))
+            if not chunks:
+                return pd.DataFrame()
+            df = pd.concat(chunks, ignore_index=True, copy=False)
             return df
         except Exception as e:
             print(f"Errore nel creare DataFrame: {str(e)}")
@@ -4,87 +4,515 @@ from langchain.agents import create_sql_agent
 from langchain.agents.agent_types import AgentType
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
+from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
+from sqlalchemy import text
 import pandas as pd
-import json
+import orjson
+import os
+import asyncio
+import hashlib
+import itertools
+import ollama
+from db_utils import (
+    SCHEMA_CACHE_TTL, AsyncQueryRunner, cached_schema, create_sql_engine,
+    invalidate_schema_cache, query_timeout, quote_identifier, quote_table_name
+)
+from query_cache import CACHE_DIR, OllamaBatchEmbeddings, QueryCache, SchemaIndex
+from fast_path import match_fast_path
+from sql_tools import TOOL_TIMEOUTS, TimeoutSQLDatabaseToolkit
+
+# Prompt di sistema condiviso: resta identico tra le chiamate cosi' che Ollama
+# possa riutilizzare la KV cache del prefisso (sistema + schema)
+SQL_SYSTEM_PROMPT = """You are an expert SQL Server assistant. 
+            Rules:
+            - Use TOP instead of LIMIT for SQL Server
+            - Use square brackets for names with spaces
+            - Be precise and explain your reasoning
+            - Return clear, executable SQL queries"""
+
+# Parametri di generazione ottimizzati per SQL
+OLLAMA_OPTIONS = {
+    "temperature": 0,
+    "num_ctx": 4096,
+    "num_predict": 1024,
+    "repeat_penalty": 1.1,
+    "top_k": 10,
+    "top_p": 0.3,
+}
+
+# Modello di embedding per cache semantica e indice delle tabelle: un modello
+# dedicato distingue domande che differiscono solo per tabella o numero
+DEFAULT_EMBEDDING_MODEL = "nomic-embed-text"
+
+# Per quanto tempo Ollama mantiene il modello (e la KV cache) in memoria
+OLLAMA_KEEP_ALIVE = "1h"
+
+# Durata di permanenza del modello dopo il precalcolo del contesto dello schema
+SCHEMA_CONTEXT_KEEP_ALIVE = "24h"
+
+# Query statistiche parametrizzate: il testo SQL non cambia tra le tabelle,
+# quindi SQL Server (sp_executesql) e il driver ODBC riusano piano e statement
+PRIMARY_KEY_QUERY = text("""
+    SELECT k.COLUMN_NAME
+    FROM INFORMATION_SCHEMA.TABLE_CONSTRAINTS t
+    JOIN INFORMATION_SCHEMA.KEY_COLUMN_USAGE k
+        ON k.CONSTRAINT_NAME = t.CONSTRAINT_NAME
+        AND k.TABLE_SCHEMA = t.TABLE_SCHEMA
+    WHERE t.CONSTRAINT_TYPE = 'PRIMARY KEY'
+        AND t.TABLE_SCHEMA = :schema
+        AND t.TABLE_NAME = :name
+    ORDER BY k.ORDINAL_POSITION
+""")
+
+# Sotto questa soglia di righe i distinti si contano sull'intera tabella:
+# TABLESAMPLE campiona per pagine e su tabelle piccole restituisce spesso 0 righe
+DISTINCT_SAMPLE_MIN_ROWS = 100_000
+
+ROW_COUNT_QUERY = text("""
+    SELECT SUM(row_count) AS total_rows
+    FROM sys.dm_db_partition_stats
+    WHERE object_id = OBJECT_ID(:table) AND index_id IN (0, 1)
+""")
+
+# Intero catalogo colonne dello schema in un'unica query (un solo stream TDS)
+ALL_COLUMNS_QUERY = text("""
+    SELECT t.name, c.name, ty.name, c.max_length, c.precision, c.scale,
+           CASE WHEN pk.column_id IS NULL THEN 0 ELSE 1 END AS is_pk,
+           fk.ref_table, fk.ref_column
+    FROM sys.tables t
+    JOIN sys.schemas s ON s.schema_id = t.schema_id
+    JOIN sys.columns c ON c.object_id = t.object_id
+    JOIN sys.types ty ON ty.user_type_id = c.user_type_id
+    LEFT JOIN (
+        SELECT ic.object_id, ic.column_id
+        FROM sys.index_columns ic
+        JOIN sys.indexes i ON i.object_id = ic.object_id AND i.index_id = ic.index_id
+        WHERE i.is_primary_key = 1
+    ) pk ON pk.object_id = c.object_id AND pk.column_id = c.column_id
+    OUTER APPLY (
+        SELECT TOP 1 rt.name AS ref_table, rc.name AS ref_column
+        FROM sys.foreign_key_columns fkc
+        JOIN sys.tables rt ON rt.object_id = fkc.referenced_object_id
+        JOIN sys.columns rc ON rc.object_id = fkc.referenced_object_id
+                           AND rc.column_id = fkc.referenced_column_id
+        WHERE fkc.parent_object_id = c.object_id AND fkc.parent_column_id = c.column_id
+    ) fk
+    WHERE s.name = :schema
+    ORDER BY t.name, c.column_id
+""")
+
+# Tipi per cui la lunghezza fa parte della definizione della colonna
+SIZED_TYPES = {"char", "varchar", "binary", "varbinary", "nchar", "nvarchar"}
+
+# Tipi per cui precisione e scala fanno parte della definizione della colonna
+SCALED_TYPES = {"decimal", "numeric"}
+
+# Messaggi di stato mostrati durante lo streaming, per tool dell'agente SQL
+TOOL_STATUS_MESSAGES = {
+    "sql_db_list_tables": "Elenco tabelle...",
+    "sql_db_schema": "Recupero schema...",
+    "sql_db_query_checker": "Verifica query...",
+    "sql_db_query": "Esecuzione query...",
+}
+
+# Template del riassunto tabella, compilato una sola volta
+SUMMARY_PROMPT = PromptTemplate(
+    input_variables=["table_name", "schema", "stats"],
+    template="""
+            Tabella: {table_name}
+            
+            Schema:
+            {schema}
+            
+            Statistiche:
+            {stats}
+            
+            Fornisci un riassunto breve e utile di questa tabella.
+            """
+)
 
 class OllamaSQLAgent:
-    def __init__(self, server, database, username=None, password=None, use_windows_auth=True):
+    def __init__(self, server, database, username=None, password=None, use_windows_auth=True,
+                 schema_cache_ttl=SCHEMA_CACHE_TTL):
         """
         Inizializza l'agente SQL con Ollama
         """
+        self.schema_cache_ttl = schema_cache_ttl
+
         if use_windows_auth:
             self.connection_string = f"mssql+pyodbc://{server}/{database}?driver=ODBC+Driver+17+for+SQL+Server&trusted_connection=yes"
         else:
             self.connection_string = f"mssql+pyodbc://{username}:{password}@{server}/{database}?driver=ODBC+Driver+17+for+SQL+Server"
         
-        self.db = SQLDatabase.from_uri(self.connection_string)
+        self.db = SQLDatabase(create_sql_engine(self.connection_string))
         self.llm = None
         self.agent_executor = None
+        self._summary_chain = None
+        self.query_cache = None
+        self.cache_scope = None
+        self._schema_context = None
+        self._async_runner = None
+        self.schema_index = None
+        self.schema_top_k = 5
+    
+    def get_table_info(self, table_names=None):
+        """Restituisce lo schema (tutte le tabelle o quelle indicate) passando dalla cache"""
+        key = ",".join(sorted(table_names)) if table_names else "*"
+        return cached_schema(
+            self.connection_string, key,
+            lambda: self.db.get_table_info(table_names=table_names),
+            self.schema_cache_ttl
+        )
+    
+    def invalidate_schema_cache(self):
+        """Svuota la cache dello schema e le risposte in cache (da chiamare dopo modifiche DDL)"""
+        invalidate_schema_cache(self.connection_string)
+        if self.query_cache:
+            self.query_cache.clear_scope(self.cache_scope)
     
-    def setup_ollama(self, model_name="llama3", base_url="http://localhost:11434"):
+    @property
+    def async_runner(self):
+        """Esecutore asincrono delle query, creato al primo utilizzo"""
+        if self._async_runner is None:
+            self._async_runner = AsyncQueryRunner(self.connection_string)
+        return self._async_runner
+    
+    @property
+    def pool_health(self):
+        """Metriche del pool di connessioni asincrono"""
+        return self.async_runner.pool_health
+    
+    async def aexecute_query(self, query):
+        """Esegue una query SQL diretta senza bloccare l'event loop"""
+        try:
+            return await self.async_runner.execute(query)
+        except Exception as e:
+            return f"Errore nell'esecuzione della query: {str(e)}"
+    
+    def setup_ollama(self, model_name="llama3", base_url="http://localhost:11434", use_cache=True,
+                     precompute_schema_context=False, streaming=False, use_schema_index=True,
+                     schema_top_k=5, embedding_model=DEFAULT_EMBEDDING_MODEL):
         """Configura Ollama con parametri ottimizzati per SQL"""
+        self.model_name = model_name
+        embeddings = OllamaBatchEmbeddings(model=embedding_model, base_url=base_url)
         self.llm = Ollama(
             model=model_name,
             base_url=base_url,
-            temperature=0,
-            num_ctx=4096,
-            num_predict=1024,
-            repeat_penalty=1.1,
-            top_k=10,
-            top_p=0.3,
-            system="""You are an expert SQL Server assistant. 
-            Rules:
-            - Use TOP instead of LIMIT for SQL Server
-            - Use square brackets for names with spaces
-            - Be precise and explain your reasoning
-            - Return clear, executable SQL queries"""
+            keep_alive=OLLAMA_KEEP_ALIVE,
+            system=SQL_SYSTEM_PROMPT,
+            # Stampa su stdout i token man mano che vengono generati (debug)
+            callbacks=[StreamingStdOutCallbackHandler()] if streaming else None,
+            timeout=TOOL_TIMEOUTS["llm"],
+            **OLLAMA_OPTIONS
         )
         
-        # Creare l'agente SQL
+        # Client nativo per le chiamate chat con prefisso stabile
+        self.ollama_client = ollama.Client(host=base_url, timeout=TOOL_TIMEOUTS["llm"])
+        
+        # Chain costruita una volta e riutilizzata da tutte le chiamate
+        self._summary_chain = LLMChain(llm=self.llm, prompt=SUMMARY_PROMPT)
+        # Il contesto dello schema viene calcolato alla prima _chat_with_schema:
+        # il setup non fa I/O verso Ollama
+        self.precompute_schema_context = precompute_schema_context
+        
+        # Creare l'agente SQL: ogni tool ha il proprio timeout, max_execution_time
+        # resta il budget complessivo
         self.agent_executor = create_sql_agent(
             llm=self.llm,
-            db=self.db,
+            toolkit=TimeoutSQLDatabaseToolkit(db=self.db, llm=self.llm),
             agent_type=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
             verbose=True,
             max_iterations=10,
             max_execution_time=120
         )
+        
+        # Cache delle risposte (match esatto + semantico)
+        if use_cache:
+            self.query_cache = QueryCache(embeddings=embeddings)
+            self.cache_scope = QueryCache.make_scope(model_name, self.connection_string, embedding_model)
+        
+        # Indice delle tabelle: nel prompt solo lo schema delle tabelle rilevanti.
+        # Gli embedding vengono calcolati alla prima domanda, non nel setup
+        if use_schema_index:
+            self.schema_index = SchemaIndex(embeddings)
+            self.schema_top_k = schema_top_k
     
-    def ask_question(self, question, context=None):
-        """Fai una domanda in linguaggio naturale"""
-        if not self.agent_executor:
-            return "Errore: Configurare prima Ollama con setup_ollama()"
+    def _fetch_all_schema(self):
+        """
+        Legge colonne, chiavi primarie ed esterne di tutte le tabelle dai
+        cataloghi sys.* con una sola query
+        
+        Returns:
+            Dizionario {tabella: [(colonna, tipo), ...]} nell'ordine delle colonne;
+            il tipo e' annotato con "PK" e "FK->tabella(colonna)"
+        """
+        with self.db._engine.connect() as conn:
+            rows = conn.execute(ALL_COLUMNS_QUERY, {"schema": self.db._schema or "dbo"}).fetchall()
+        
+        usable_tables = set(self.db.get_usable_table_names())
+        schema = {}
+        for table, columns in itertools.groupby(rows, key=lambda row: row[0]):
+            if table not in usable_tables:
+                continue
+            schema[table] = []
+            for _, column, type_name, max_length, precision, scale, is_pk, ref_table, ref_column in columns:
+                if type_name in SIZED_TYPES:
+                    if max_length == -1:
+                        length = "MAX"
+                    else:
+                        # nchar/nvarchar: max_length e' in byte, 2 per carattere
+                        length = max_length // 2 if type_name.startswith("n") else max_length
+                    type_name = f"{type_name}({length})"
+                elif type_name in SCALED_TYPES:
+                    type_name = f"{type_name}({precision},{scale})"
+                # Chiavi nel tipo: il modello vede come unire le tabelle
+                if is_pk:
+                    type_name += " PK"
+                if ref_table:
+                    type_name += f" FK->{ref_table}({ref_column})"
+                schema[table].append((column, type_name))
+        return schema
+    
+    def _get_table_columns(self):
+        """Restituisce {tabella: [(colonna, tipo), ...]} per tutte le tabelle"""
+        return cached_schema(self.connection_string, "__columns__", self._fetch_all_schema, self.schema_cache_ttl)
+    
+    def build_schema_index(self):
+        """
+        Calcola (o ricarica da disco) gli embedding di tabelle e colonne
+        
+        L'indice e' identificato dall'impronta dello schema: dopo modifiche DDL
+        (e invalidate_schema_cache) viene ricostruito automaticamente.
+        """
+        documents = {
+            table: table + "\n" + ", ".join(f"{name} {type_}" for name, type_ in columns)
+            for table, columns in self._get_table_columns().items()
+        }
+        self.schema_index.build(documents)
+    
+    def _agent_input(self, question):
+        """Aggiunge alla domanda lo schema delle sole tabelle rilevanti"""
+        if not self.schema_index:
+            return question
+        
+        try:
+            self.build_schema_index()
+            tables = self.schema_index.search(question, k=self.schema_top_k)
+        except Exception as e:
+            # Embedding non disponibili (es. Ollama giu'): l'agente esplora lo schema da se'
+            print(f"Indice dello schema non disponibile: {e}")
+            return question
+        
+        if not tables:
+            return question
         
-        # Aggiungi contesto se fornito
+        return f"""{question}
+            
+            Schema delle tabelle piu' rilevanti:
+            {self.get_table_info(tables)}
+            """
+    
+    def _enhance_question(self, question, context=None):
+        """Aggiungi contesto alla domanda se fornito"""
         if context:
-            enhanced_question = f"""
+            return f"""
             Contesto: {context}
             
             Domanda: {question}
             
             Genera una query SQL Server appropriata e eseguila.
             """
-        else:
-            enhanced_question = question
+        return question
+    
+    def _route_question(self, question):
+        """
+        Risponde direttamente alle domande che corrispondono a un template noto
+        
+        Returns:
+            Il risultato della query, o None se nessun template corrisponde
+            (o la query fallisce) e serve l'agente
+        """
+        route = match_fast_path(question)
+        if route is None:
+            return None
+        
+        template, params = route
+        params["table"] = quote_table_name(params["table"])
+        try:
+            # Stesso budget del tool sql_db_query dell'agente
+            with query_timeout(TOOL_TIMEOUTS["sql_db_query"]):
+                return self.db.run(template.format(**params))
+        except Exception:
+            return None
+    
+    def ask_question(self, question, context=None):
+        """Fai una domanda in linguaggio naturale"""
+        if not self.agent_executor:
+            return "Errore: Configurare prima Ollama con setup_ollama()"
+        
+        # Domande banali: nessuna chiamata LLM
+        if not context:
+            routed = self._route_question(question)
+            if routed is not None:
+                return routed
+        
+        enhanced_question = self._enhance_question(question, context)
         
         try:
-            response = self.agent_executor.run(enhanced_question)
+            if self.query_cache:
+                cached = self.query_cache.get(enhanced_question, self.cache_scope)
+                if cached is not None:
+                    return cached
+            
+            response = self.agent_executor.run(self._agent_input(enhanced_question))
+            
+            if self.query_cache:
+                self.query_cache.put(enhanced_question, self.cache_scope, response)
             return response
         except Exception as e:
             return f"Errore: {str(e)}"
     
+    async def astream_ask(self, question, context=None):
+        """
+        Versione in streaming di ask_question
+        
+        Produce dizionari {"type": ..., "content": ...} man mano che l'agente
+        lavora: "token" per ogni frammento generato dal LLM, "status" a ogni
+        passo ReAct (es. "Esecuzione query...") e infine "output" con la
+        risposta. Adatto a una StreamingResponse di FastAPI.
+        """
+        if not self.agent_executor:
+            yield {"type": "output", "content": "Errore: Configurare prima Ollama con setup_ollama()"}
+            return
+        
+        try:
+            # Router, cache e selezione dello schema fanno I/O sincrono
+            # (database, SQLite, embedding HTTP): fuori dall'event loop
+            if not context:
+                routed = await asyncio.to_thread(self._route_question, question)
+                if routed is not None:
+                    yield {"type": "output", "content": routed}
+                    return
+            
+            enhanced_question = self._enhance_question(question, context)
+            
+            if self.query_cache:
+                cached = await asyncio.to_thread(self.query_cache.get, enhanced_question, self.cache_scope)
+                if cached is not None:
+                    yield {"type": "output", "content": cached}
+                    return
+            
+            agent_input = await asyncio.to_thread(self._agent_input, enhanced_question)
+            async for event in self.agent_executor.astream_events({"input": agent_input}, version="v2"):
+                kind = event["event"]
+                if kind == "on_llm_stream":
+                    chunk = event["data"]["chunk"]
+                    yield {"type": "token", "content": getattr(chunk, "text", str(chunk))}
+                elif kind == "on_tool_start":
+                    yield {"type": "status", "content": TOOL_STATUS_MESSAGES.get(event["name"], f"{event['name']}...")}
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    output = event["data"]["output"]["output"]
+                    if self.query_cache:
+                        await asyncio.to_thread(self.query_cache.put, enhanced_question, self.cache_scope, output)
+                    yield {"type": "output", "content": output}
+        except Exception as e:
+            yield {"type": "output", "content": f"Errore: {str(e)}"}
+    
+    def _schema_prompt(self):
+        # Schema compatto dal catalogo: una query invece di get_table_info per tabella
+        tables = "\n".join(
+            f"{table}({', '.join(f'{name} {type_}' for name, type_ in columns)})"
+            for table, columns in self._get_table_columns().items()
+        )
+        return f"Schema del database:\n{tables}"
+    
+    def _get_schema_context(self):
+        """
+        Restituisce il contesto Ollama del prompt (sistema + schema), precalcolato
+        
+        Il contesto viene calcolato una sola volta con /api/generate e salvato in
+        ~/.cache/sqlrag/schema_kv2_<hash>.json, con hash su prompt e modello:
+        se lo schema cambia il file precedente non viene piu' usato.
+        """
+        schema_prompt = self._schema_prompt()
+        digest = hashlib.sha256(
+            (SQL_SYSTEM_PROMPT + schema_prompt + self.model_name).encode("utf-8")
+        ).hexdigest()
+        
+        if self._schema_context and self._schema_context[0] == digest:
+            return self._schema_context[1]
+        
+        path = os.path.join(CACHE_DIR, f"schema_kv2_{digest}.json")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                context = orjson.loads(f.read())
+        else:
+            response = self.ollama_client.generate(
+                model=self.model_name,
+                system=SQL_SYSTEM_PROMPT,
+                prompt=schema_prompt,
+                keep_alive=SCHEMA_CONTEXT_KEEP_ALIVE,
+                options={**OLLAMA_OPTIONS, "num_predict": 1}
+            )
+            # Il contesto include anche il token generato: va tolto, altrimenti
+            # ogni risposta successiva continuerebbe quella parziale
+            context = response["context"]
+            generated = response.get("eval_count") or 0
+            if generated:
+                context = context[:-generated]
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(orjson.dumps(context))
+        
+        self._schema_context = (digest, context)
+        return context
+    
+    def _chat_with_schema(self, message):
+        """
+        Invia un messaggio a Ollama dopo un prefisso stabile (sistema + schema)
+        
+        Con il contesto precalcolato Ollama riparte dallo stato dello schema;
+        altrimenti il contenuto statico viene prima e la domanda per ultima, cosi'
+        tra una chiamata e l'altra cambia solo la coda e Ollama riusa la KV cache
+        del prefisso.
+        """
+        if self.precompute_schema_context:
+            try:
+                context = self._get_schema_context()
+            except Exception as e:
+                # Senza contesto precalcolato si ripiega sulla chat con prefisso stabile
+                print(f"Contesto dello schema non disponibile: {e}")
+                context = None
+            
+            if context:
+                response = self.ollama_client.generate(
+                    model=self.model_name,
+                    prompt=message,
+                    context=context,
+                    keep_alive=SCHEMA_CONTEXT_KEEP_ALIVE,
+                    options=OLLAMA_OPTIONS
+                )
+                return response["response"]
+        
+        messages = [
+            {"role": "system", "content": SQL_SYSTEM_PROMPT},
+            {"role": "system", "content": self._schema_prompt()},
+            {"role": "user", "content": message},
+        ]
+        response = self.ollama_client.chat(
+            model=self.model_name,
+            messages=messages,
+            keep_alive=OLLAMA_KEEP_ALIVE,
+            options=OLLAMA_OPTIONS
+        )
+        return response["message"]["content"]
+    
     def generate_sql_only(self, question):
         """Genera solo la query SQL senza eseguirla"""
         if not self.llm:
             return "Errore: Configurare prima Ollama con setup_ollama()"
         
-        # Template per generare solo SQL
-        sql_template = PromptTemplate(
-            input_variables=["question", "schema"],
-            template="""
-            Basandoti su questo schema del database:
-            {schema}
-            
+        message = f"""
             Genera SOLO la query SQL Server per rispondere a questa domanda:
             {question}
             
@@ -93,16 +521,9 @@ class OllamaSQLAgent:
             - Usa square brackets per nomi con spazi
             - Restituisci SOLO il codice SQL, niente spiegazioni
             """
-        )
-        
-        # Ottieni schema delle tabelle
-        schema = self.db.get_table_info()
-        
-        # Crea la chain
-        sql_chain = LLMChain(llm=self.llm, prompt=sql_template)
         
         try:
-            result = sql_chain.run(question=question, schema=schema)
+            result = self._chat_with_schema(message)
             return result.strip()
         except Exception as e:
             return f"Errore nella generazione SQL: {str(e)}"
@@ -112,65 +533,74 @@ class OllamaSQLAgent:
         if not self.llm:
             return "Errore: Configurare prima Ollama con setup_ollama()"
         
-        explain_template = PromptTemplate(
-            input_variables=["query"],
-            template="""
+        message = f"""
             Spiega in italiano cosa fa questa query SQL Server:
             
-            {query}
+            {sql_query}
             
             Fornisci una spiegazione chiara e concisa.
             """
-        )
-        
-        explain_chain = LLMChain(llm=self.llm, prompt=explain_template)
         
         try:
-            explanation = explain_chain.run(query=sql_query)
+            explanation = self._chat_with_schema(message)
             return explanation
         except Exception as e:
             return f"Errore nella spiegazione: {str(e)}"
     
+    def _get_primary_key(self, conn, table_name):
+        """Restituisce le colonne della chiave primaria, in ordine (tupla vuota se assente)"""
+        schema_name, _, name = table_name.rpartition(".")
+        params = {"schema": schema_name or "dbo", "name": name}
+        
+        return cached_schema(
+            self.connection_string, f"{table_name}:pk",
+            lambda: tuple(row[0] for row in conn.execute(PRIMARY_KEY_QUERY, params)),
+            self.schema_cache_ttl
+        )
+    
+    def _get_table_stats(self, table_name):
+        """Statistiche economiche: righe da metadati e distinti stimati sulla chiave primaria"""
+        with self.db._engine.connect() as conn:
+            return self._table_stats(conn, table_name)
+    
+    def _table_stats(self, conn, table_name):
+        # Numero di righe dai metadati delle partizioni, senza scansione
+        stats = {"total_rows": conn.execute(ROW_COUNT_QUERY, {"table": table_name}).scalar()}
+        
+        # Distinti stimati (HyperLogLog) sulla chiave primaria. Con chiave composta
+        # la sola prima colonna non descrive la tabella: stima omessa
+        pk = self._get_primary_key(conn, table_name)
+        if len(pk) == 1:
+            # Gli identificatori non sono parametrizzabili: vanno quotati
+            distinct_query = (
+                "SELECT APPROX_COUNT_DISTINCT(" + quote_identifier(pk[0]) + ") "
+                "FROM " + quote_table_name(table_name)
+            )
+            if (stats["total_rows"] or 0) < DISTINCT_SAMPLE_MIN_ROWS:
+                stats["approx_distinct_pk"] = conn.execute(text(distinct_query)).scalar()
+            else:
+                # Conteggio sul solo campione: l'etichetta lo dice al LLM
+                distinct_query += " TABLESAMPLE (1 PERCENT)"
+                stats["approx_distinct_pk_in_1pct_sample"] = conn.execute(text(distinct_query)).scalar()
+        
+        return stats
+    
     def get_table_summary(self, table_name):
         """Ottieni un riassunto dei dati in una tabella"""
         try:
-            # Query per statistiche base
-            stats_query = f"""
-            SELECT 
-                COUNT(*) as total_rows,
-                COUNT(DISTINCT *) as unique_rows
-            FROM [{table_name}]
-            """
-            
             # Schema della tabella
-            schema = self.db.get_table_info(table_names=[table_name])
+            schema = self.get_table_info([table_name])
             
             # Esegui query statistiche
-            stats = self.db.run(stats_query)
+            stats = self._get_table_stats(table_name)
             
             # Genera riassunto con LLM
             if self.llm:
-                summary_template = PromptTemplate(
-                    input_variables=["table_name", "schema", "stats"],
-                    template="""
-                    Tabella: {table_name}
-                    
-                    Schema:
-                    {schema}
-                    
-                    Statistiche:
-                    {stats}
-                    
-                    Fornisci un riassunto breve e utile di questa tabella.
-                    """
-                )
-                
-                summary_chain = LLMChain(llm=self.llm, prompt=summary_template)
-                summary = summary_chain.run(
-                    table_name=table_name,
-                    schema=schema,
-                    stats=stats
-                )
+                summary = self._summary_chain.invoke({
+                    "table_name": table_name,
+                    "schema": schema,
+                    "stats": stats
+                })["text"]
                 
                 return {
                     "schema": schema,
@@ -186,6 +616,54 @@ class OllamaSQLAgent:
                 
         except Exception as e:
             return f"Errore nel riassunto tabella: {str(e)}"
+    
+    async def aget_table_summary(self, table_name):
+        """Versione asincrona di get_table_summary: schema e statistiche in parallelo"""
+        try:
+            loop = asyncio.get_running_loop()
+            
+            # Schema e statistiche sono I/O indipendenti: eseguiti in contemporanea,
+            # le statistiche sul pool asincrono
+            schema, stats = await asyncio.gather(
+                loop.run_in_executor(None, self.get_table_info, [table_name]),
+                self.async_runner.run_sync(self._table_stats, table_name)
+            )
+            
+            if self.llm:
+                result = await self._summary_chain.ainvoke({
+                    "table_name": table_name,
+                    "schema": schema,
+                    "stats": stats
+                })
+                summary = result["text"]
+            else:
+                summary = "LLM non configurato per il riassunto"
+            
+            return {
+                "schema": schema,
+                "statistics": stats,
+                "summary": summary
+            }
+        except Exception as e:
+            return f"Errore nel riassunto tabella: {str(e)}"
+    
+    async def aget_many_table_summaries(self, table_names, max_parallel=5):
+        """
+        Riassunti di piu' tabelle in parallelo
+        
+        Args:
+            table_names: Lista dei nomi delle tabelle
+            max_parallel: Numero massimo di riassunti contemporanei (non superare
+                la dimensione del pool di connessioni)
+        """
+        semaphore = asyncio.Semaphore(max_parallel)
+        
+        async def summarize(table_name):
+            async with semaphore:
+                return await self.aget_table_summary(table_name)
+        
+        summaries = await asyncio.gather(*[summarize(t) for t in table_names])
+        return dict(zip(table_names, summaries))
 
 # Esempio di utilizzo
 if __name__ == "__main__":
@@ -218,4 +696,4 @@ if __name__ == "__main__":
     # Riassunto tabella
     print("\n=== Riassunto tabella ===")
     summary = agent.get_table_summary("Person.Person")
-    print(json.dumps(summary, indent=2, ensure_ascii=False))
\ No newline at end of file
+    print(orjson.dumps(summary, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS, default=str).decode())
\ No newline at end of file
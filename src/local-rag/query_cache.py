@@ -0,0 +1,436 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import requests
+
+# Directory di default per le cache persistenti
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "sqlrag")
+
+# Testi inviati a Ollama in ogni richiesta di embedding
+EMBED_BATCH_SIZE = 128
+
+# Timeout (secondi) di ogni richiesta di embedding: un Ollama bloccato non
+# deve bloccare la domanda
+EMBED_TIMEOUT = 30
+
+# Validita' di default (secondi) delle risposte in cache: i dati cambiano
+QUERY_CACHE_TTL = 3600
+
+# Risposte da non mettere mai in cache: errori, timeout dei tool ed
+# esecuzioni interrotte dall'AgentExecutor
+UNCACHEABLE_MARKERS = ("Agent stopped due to", "timeout di", "Errore")
+
+
+def embed_batch(texts, model, base_url="http://localhost:11434", batch_size=EMBED_BATCH_SIZE,
+                timeout=EMBED_TIMEOUT, session=None):
+    """
+    Calcola gli embedding di piu' testi con una richiesta /api/embed per blocco
+
+    Args:
+        session: requests.Session da riutilizzare; se None ne viene aperta una
+            per la sola chiamata
+
+    Returns:
+        Array float32 di forma (N, D)
+    """
+    if session is None:
+        with requests.Session() as own_session:
+            return embed_batch(texts, model, base_url, batch_size, timeout, own_session)
+
+    vectors = []
+    for i in range(0, len(texts), batch_size):
+        response = session.post(
+            f"{base_url}/api/embed",
+            json={"model": model, "input": texts[i:i + batch_size]},
+            timeout=timeout
+        )
+        response.raise_for_status()
+        vectors.extend(response.json()["embeddings"])
+    return np.asarray(vectors, dtype=np.float32)
+
+
+class OllamaBatchEmbeddings:
+    """Embedding Ollama compatibili con LangChain, con embed_documents a blocchi"""
+
+    def __init__(self, model, base_url="http://localhost:11434", batch_size=EMBED_BATCH_SIZE,
+                 timeout=EMBED_TIMEOUT):
+        self.model = model
+        self.base_url = base_url
+        self.batch_size = batch_size
+        self.timeout = timeout
+        # Una sola sessione: connessione keep-alive riusata da tutte le chiamate
+        self.session = requests.Session()
+
+    def embed_documents(self, texts):
+        return embed_batch(
+            texts, self.model, self.base_url, self.batch_size, self.timeout, self.session
+        ).tolist()
+
+    def embed_query(self, text):
+        return embed_batch(
+            [text], self.model, self.base_url, timeout=self.timeout, session=self.session
+        )[0].tolist()
+
+
+def is_cacheable(response):
+    """True se la risposta e' un risultato valido e non un errore o un'interruzione"""
+    if not isinstance(response, str) or not response.strip():
+        return False
+    return not any(marker in response for marker in UNCACHEABLE_MARKERS)
+
+
+def quantize_int8(vector):
+    """Quantizzazione simmetrica int8 con scala per vettore: vector ~= q * scale"""
+    scale = float(np.abs(vector).max()) / 127 or 1.0
+    return np.round(vector / scale).astype(np.int8), scale
+
+
+class _VectorStore:
+    """
+    Embedding normalizzati di uno scope in un'unica matrice int8 (N, D)
+    contigua, con una scala float32 per riga: 4 volte meno memoria di float32.
+    La ricerca procede per blocchi di righe (prodotti matrice-vettore), senza
+    cicli Python sulle singole voci.
+    """
+
+    # Righe convertite in float32 per volta durante la ricerca
+    BLOCK_ROWS = 1024
+
+    def __init__(self, dim):
+        self._matrix = np.empty((64, dim), dtype=np.int8)
+        self._scales = np.empty(64, dtype=np.float32)
+        self._keys = []
+        self._rows = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key, quantized, scale):
+        row = self._rows.get(key)
+        if row is None:
+            row = len(self._keys)
+            if row == len(self._matrix):
+                # Capacita' raddoppiata: append in tempo costante ammortizzato
+                grown = np.empty((2 * len(self._matrix), self._matrix.shape[1]), dtype=np.int8)
+                grown[:row] = self._matrix[:row]
+                self._matrix = grown
+                self._scales = np.resize(self._scales, 2 * len(self._scales))
+            self._keys.append(key)
+            self._rows[key] = row
+        self._matrix[row] = quantized
+        self._scales[row] = scale
+
+    def best_match(self, query):
+        """Restituisce (chiave, similarita') della voce piu' simile alla query"""
+        n = len(self._keys)
+        if not n:
+            return None, -1.0
+        # (q_i * s_i) . query == (q_i . query) * s_i: la scala si applica dopo.
+        # NumPy converte in float32 l'int8 prima del prodotto: si procede a
+        # blocchi di righe per non ricreare l'intera matrice float32 a ogni ricerca
+        best_row, best_score = 0, -np.inf
+        for start in range(0, n, self.BLOCK_ROWS):
+            stop = min(start + self.BLOCK_ROWS, n)
+            scores = (self._matrix[start:stop] @ query) * self._scales[start:stop]
+            i = int(scores.argmax())
+            if scores[i] > best_score:
+                best_row, best_score = start + i, float(scores[i])
+        return self._keys[best_row], best_score
+
+
+class QueryCache:
+    """
+    Cache delle risposte a due livelli: match esatto sulla domanda e match
+    semantico tramite similarita' coseno degli embedding.
+    Le voci sono persistite in SQLite, con un LRU in memoria davanti; gli
+    embedding sono salvati quantizzati in int8.
+    Thread-safe: SQLite e strutture in memoria sono protetti da un lock, le
+    chiamate di embedding avvengono fuori dal lock.
+    """
+
+    _COLUMNS = "(question_hash, scope, embedding, response, ts, embedding_scale)"
+
+    def __init__(self, path=None, embeddings=None, threshold=0.95, max_memory_items=256,
+                 ttl_seconds=QUERY_CACHE_TTL):
+        """
+        Args:
+            path: File SQLite della cache (default ~/.cache/sqlrag/query_cache.sqlite)
+            embeddings: Modello di embedding LangChain (None per il solo match esatto)
+            threshold: Similarita' coseno minima per un hit semantico
+            max_memory_items: Numero di risposte tenute nell'LRU in memoria
+            ttl_seconds: Validita' delle risposte in secondi
+        """
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, "query_cache.sqlite")
+
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_memory_items = max_memory_items
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._pending_embeddings = {}
+        self._vectors = {}
+        # Serializza connessione SQLite (condivisa tra thread), LRU e matrici
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS query_cache (
+                question_hash TEXT PRIMARY KEY,
+                scope TEXT,
+                embedding BLOB,
+                response TEXT,
+                ts REAL,
+                embedding_scale REAL
+            )
+        """)
+        # Cache create prima della quantizzazione: embedding float32 senza scala
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(query_cache)")]
+        if "embedding_scale" not in columns:
+            self.conn.execute("ALTER TABLE query_cache ADD COLUMN embedding_scale REAL")
+        self.conn.commit()
+
+    @staticmethod
+    def make_scope(model, db_signature, embedding_model=None):
+        """
+        Identifica modello, database e modello di embedding: le risposte valgono
+        solo nello stesso scope (embedding di modelli diversi non sono confrontabili)
+        """
+        return hashlib.sha256(f"{model}\n{db_signature}\n{embedding_model}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _hash(question, scope):
+        return hashlib.sha256(f"{question}\n{scope}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key, response, ts):
+        self._memory[key] = (response, ts)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _embed(self, question):
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _embed_many(self, questions):
+        vectors = np.asarray(self.embeddings.embed_documents(questions), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+    def _scope_vectors(self, scope, dim):
+        """Matrice degli embedding dello scope, caricata da SQLite al primo uso"""
+        store = self._vectors.get(scope)
+        if store is None:
+            store = _VectorStore(dim)
+            for key, blob, scale in self.conn.execute(
+                "SELECT question_hash, embedding, embedding_scale FROM query_cache "
+                "WHERE scope = ? AND embedding IS NOT NULL AND ts >= ?",
+                (scope, time.time() - self.ttl_seconds)
+            ):
+                if scale is None:
+                    quantized, scale = quantize_int8(np.frombuffer(blob, dtype=np.float32))
+                else:
+                    quantized = np.frombuffer(blob, dtype=np.int8)
+                if quantized.shape == (dim,):
+                    store.add(key, quantized, scale)
+            self._vectors[scope] = store
+        return store
+
+    def _response(self, key):
+        """Risposta per la chiave, se presente e non scaduta"""
+        if key in self._memory:
+            response, ts = self._memory[key]
+        else:
+            row = self.conn.execute(
+                "SELECT response, ts FROM query_cache WHERE question_hash = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            response, ts = row
+
+        if ts is None or time.time() - ts > self.ttl_seconds:
+            self._memory.pop(key, None)
+            return None
+
+        self._remember(key, response, ts)
+        return response
+
+    def get(self, question, scope):
+        """Restituisce la risposta in cache per la domanda (None se assente)"""
+        key = self._hash(question, scope)
+
+        # Livello 1: match esatto (memoria, poi SQLite)
+        with self._lock:
+            response = self._response(key)
+        if response is not None or self.embeddings is None:
+            return response
+
+        # Livello 2: domanda semanticamente equivalente nello stesso scope
+        query_embedding = self._embed(question)
+        with self._lock:
+            # Riutilizzato da put() per non ricalcolare l'embedding dopo un miss
+            self._pending_embeddings = {key: query_embedding}
+
+            best_key, best_score = self._scope_vectors(scope, len(query_embedding)).best_match(query_embedding)
+            if best_score >= self.threshold:
+                return self._response(best_key)
+        return None
+
+    def put(self, question, scope, response):
+        """Salva la risposta per la domanda (errori e interruzioni sono ignorati)"""
+        if not is_cacheable(response):
+            return
+
+        key = self._hash(question, scope)
+
+        with self._lock:
+            embedding = self._pending_embeddings.pop(key, None)
+        if embedding is None and self.embeddings is not None:
+            embedding = self._embed(question)
+
+        quantized, scale = quantize_int8(embedding) if embedding is not None else (None, None)
+        with self._lock:
+            now = time.time()
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO query_cache {self._COLUMNS} VALUES (?, ?, ?, ?, ?, ?)",
+                (key, scope, quantized.tobytes() if quantized is not None else None, response, now, scale)
+            )
+            self.conn.commit()
+            self._remember(key, response, now)
+            if quantized is not None and scope in self._vectors:
+                self._vectors[scope].add(key, quantized, scale)
+
+    def put_many(self, items, scope):
+        """
+        Popola la cache con piu' coppie (domanda, risposta), calcolando gli
+        embedding in blocco invece di una richiesta per domanda
+        """
+        items = [(question, response) for question, response in items if is_cacheable(response)]
+        if not items:
+            return
+
+        questions = [question for question, _ in items]
+        embeddings = self._embed_many(questions) if self.embeddings is not None else [None] * len(items)
+
+        with self._lock:
+            now = time.time()
+            rows = []
+            for (question, response), embedding in zip(items, embeddings):
+                key = self._hash(question, scope)
+                quantized, scale = quantize_int8(embedding) if embedding is not None else (None, None)
+                rows.append((key, scope, quantized.tobytes() if quantized is not None else None, response, now, scale))
+                self._remember(key, response, now)
+                if quantized is not None and scope in self._vectors:
+                    self._vectors[scope].add(key, quantized, scale)
+
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO query_cache {self._COLUMNS} VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self.conn.commit()
+
+    def clear_scope(self, scope):
+        """Elimina le risposte di uno scope (es. dopo modifiche allo schema)"""
+        with self._lock:
+            keys = [row[0] for row in self.conn.execute(
+                "SELECT question_hash FROM query_cache WHERE scope = ?", (scope,)
+            )]
+            for key in keys:
+                self._memory.pop(key, None)
+            self._vectors.pop(scope, None)
+            self.conn.execute("DELETE FROM query_cache WHERE scope = ?", (scope,))
+            self.conn.commit()
+
+    def clear(self):
+        """Svuota la cache (memoria e disco)"""
+        with self._lock:
+            self._memory.clear()
+            self._pending_embeddings.clear()
+            self._vectors.clear()
+            self.conn.execute("DELETE FROM query_cache")
+            self.conn.commit()
+
+
+class SchemaIndex:
+    """
+    Indice vettoriale delle tabelle (nome + colonne) per selezionare solo lo
+    schema rilevante per una domanda. Gli embedding sono persistiti su disco in
+    ~/.cache/sqlrag/schema_index_<fingerprint>.npz e ricalcolati solo quando
+    lo schema cambia.
+    """
+
+    def __init__(self, embeddings, cache_dir=CACHE_DIR):
+        """
+        Args:
+            embeddings: Modello di embedding LangChain
+            cache_dir: Directory dei file dell'indice
+        """
+        self.embeddings = embeddings
+        self.cache_dir = cache_dir
+        self.fingerprint = None
+        self.table_names = []
+        self._matrix = None
+
+    def build(self, documents):
+        """
+        Indicizza le tabelle, riusando l'indice su disco se lo schema non e' cambiato
+
+        Args:
+            documents: Dizionario {nome_tabella: descrizione (nome + colonne)}
+        """
+        names = sorted(documents)
+        digest = hashlib.sha256()
+        digest.update(getattr(self.embeddings, "model", "").encode("utf-8"))
+        for name in names:
+            digest.update(f"\n{name}\n{documents[name]}".encode("utf-8"))
+        fingerprint = digest.hexdigest()
+
+        if fingerprint == self.fingerprint:
+            return
+
+        if not names:
+            # Nessuna tabella utilizzabile (es. schema di default vuoto): indice vuoto
+            self.fingerprint = fingerprint
+            self.table_names = []
+            self._matrix = None
+            return
+
+        path = os.path.join(self.cache_dir, f"schema_index_{fingerprint}.npz")
+        if os.path.exists(path):
+            with np.load(path) as data:
+                matrix = data["embeddings"]
+        else:
+            matrix = np.asarray(
+                self.embeddings.embed_documents([documents[name] for name in names]),
+                dtype=np.float32
+            )
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            matrix = matrix / norms
+            os.makedirs(self.cache_dir, exist_ok=True)
+            np.savez(path, embeddings=matrix)
+
+        self.fingerprint = fingerprint
+        self.table_names = names
+        self._matrix = matrix
+
+    def search(self, question, k=5):
+        """Restituisce le k tabelle piu' simili alla domanda, dalla piu' rilevante"""
+        if self._matrix is None or not self.table_names:
+            return []
+
+        query = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        query /= np.linalg.norm(query) or 1
+        scores = self._matrix @ query
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self.table_names[i] for i in top]
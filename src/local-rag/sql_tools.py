@@ -0,0 +1,100 @@
+import asyncio
+
+from langchain_community.agent_toolkits import SQLDatabaseToolkit
+from langchain_community.tools.sql_database.tool import InfoSQLDatabaseTool
+
+try:
+    from langchain_community.tools.sql_database.tool import QuerySQLDatabaseTool
+except ImportError:
+    # langchain-community < 0.3.12
+    from langchain_community.tools.sql_database.tool import QuerySQLDataBaseTool as QuerySQLDatabaseTool
+
+from db_utils import query_timeout
+
+# Budget in secondi per singolo tool dell'agente (e per singola chiamata LLM)
+TOOL_TIMEOUTS = {
+    "sql_db_query": 30,
+    "sql_db_schema": 5,
+    "llm": 60,
+}
+
+# SQLSTATE ODBC di "Query timeout expired"
+ODBC_TIMEOUT_STATE = "HYT00"
+
+
+def _timeout_error(tool_name, timeout):
+    """Errore strutturato che l'agente puo' leggere e su cui puo' ragionare"""
+    return (
+        f"Errore: timeout di {timeout}s superato per il tool {tool_name}. "
+        "Prova una query piu' semplice o piu' selettiva (es. TOP, filtri WHERE)."
+    )
+
+
+def _run_with_timeout(tool, run, timeout, *args):
+    """
+    Esegue run(*args) con il timeout ODBC: SQL Server annulla l'istruzione
+    allo scadere, quindi non restano query o thread appesi
+    """
+    with query_timeout(timeout):
+        try:
+            result = run(*args)
+        except Exception as e:
+            if ODBC_TIMEOUT_STATE in str(e):
+                return _timeout_error(tool.name, timeout)
+            raise
+
+    # I tool SQL restituiscono gli errori come testo ("Error: ...")
+    if isinstance(result, str) and ODBC_TIMEOUT_STATE in result:
+        return _timeout_error(tool.name, timeout)
+    return result
+
+
+class TimeoutQuerySQLDataBaseTool(QuerySQLDatabaseTool):
+    """Esecuzione query SQL con un proprio timeout"""
+
+    timeout: int = TOOL_TIMEOUTS["sql_db_query"]
+
+    def _run(self, query, run_manager=None):
+        return _run_with_timeout(self, super()._run, self.timeout, query)
+
+    async def _arun(self, query, run_manager=None):
+        # to_thread copia il contesto: il timeout vale anche nel thread
+        return await asyncio.to_thread(
+            _run_with_timeout, self, super()._run, self.timeout, query
+        )
+
+
+class TimeoutInfoSQLDatabaseTool(InfoSQLDatabaseTool):
+    """Lettura dello schema delle tabelle con un proprio timeout"""
+
+    timeout: int = TOOL_TIMEOUTS["sql_db_schema"]
+
+    def _run(self, table_names, run_manager=None):
+        return _run_with_timeout(self, super()._run, self.timeout, table_names)
+
+    async def _arun(self, table_names, run_manager=None):
+        return await asyncio.to_thread(
+            _run_with_timeout, self, super()._run, self.timeout, table_names
+        )
+
+
+class TimeoutSQLDatabaseToolkit(SQLDatabaseToolkit):
+    """Toolkit SQL in cui query e schema hanno ciascuno il proprio timeout"""
+
+    def get_tools(self):
+        tools = []
+        for tool in super().get_tools():
+            # Confronto sul nome: la classe del tool query cambia tra le versioni
+            # di langchain-community (QuerySQLDataBaseTool -> QuerySQLDatabaseTool)
+            if tool.name == "sql_db_query":
+                tool = TimeoutQuerySQLDataBaseTool(
+                    db=self.db, description=tool.description,
+                    timeout=TOOL_TIMEOUTS["sql_db_query"]
+                )
+            elif tool.name == "sql_db_schema":
+                tool = TimeoutInfoSQLDatabaseTool(
+                    db=self.db, description=tool.description,
+                    timeout=TOOL_TIMEOUTS["sql_db_schema"]
+                )
+            tools.append(tool)
+        return tools
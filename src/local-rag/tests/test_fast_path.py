@@ -0,0 +1,44 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fast_path import FAST_PATH_MAX_ROWS, match_fast_path
+
+
+class MatchFastPathTest(unittest.TestCase):
+    def test_bare_count_question_matches(self):
+        template, params = match_fast_path("Quante righe ha la tabella Person.Person?")
+        self.assertEqual(template, "SELECT COUNT(*) FROM {table}")
+        self.assertEqual(params, {"table": "Person.Person"})
+
+        _, params = match_fast_path("quanti record ci sono nella tabella Sales.Customer")
+        self.assertEqual(params, {"table": "Sales.Customer"})
+
+    def test_bare_top_question_matches(self):
+        template, params = match_fast_path("Mostra i primi 10 di Person.Person.")
+        self.assertEqual(template, "SELECT TOP {n} * FROM {table}")
+        self.assertEqual(params, {"n": "10", "table": "Person.Person"})
+
+    def test_top_question_over_row_cap_falls_through(self):
+        self.assertIsNotNone(match_fast_path(f"primi {FAST_PATH_MAX_ROWS} di Sales.SalesOrderDetail"))
+        self.assertIsNone(match_fast_path("primi 10000000 di Sales.SalesOrderDetail"))
+
+    def test_filtered_questions_fall_through(self):
+        questions = [
+            "Quante righe della tabella Sales.SalesOrderHeader hanno Status = 5?",
+            "Quanti record nella tabella Person.Person hanno LastName che inizia per A?",
+            "primi 10 di Person.Person ordinati per LastName",
+            "Quante righe ha la tabella Person.Person dove PersonType = 'EM'?",
+        ]
+        for question in questions:
+            with self.subTest(question=question):
+                self.assertIsNone(match_fast_path(question))
+
+    def test_unrelated_question_falls_through(self):
+        self.assertIsNone(match_fast_path("Quante persone ci sono nel database?"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import hashlib
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from query_cache import QueryCache, _VectorStore, quantize_int8
+
+DIM = 32
+
+
+class FakeEmbeddings:
+    """Vettori casuali deterministici per testo; gli alias puntano a un altro testo"""
+
+    def __init__(self, aliases=None):
+        self.aliases = aliases or {}
+
+    def _vector(self, text):
+        text, noise = self.aliases.get(text, (text, 0.0))
+        rng = np.random.default_rng(int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16))
+        vector = rng.standard_normal(DIM)
+        if noise:
+            vector += noise * np.random.default_rng(0).standard_normal(DIM)
+        return vector.astype(np.float32)
+
+    def embed_query(self, text):
+        return self._vector(text).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text).tolist() for text in texts]
+
+
+class QuantizeInt8Test(unittest.TestCase):
+    def test_round_trip_is_close(self):
+        vector = np.random.default_rng(1).standard_normal(DIM).astype(np.float32)
+        quantized, scale = quantize_int8(vector)
+        self.assertEqual(quantized.dtype, np.int8)
+        self.assertLessEqual(np.abs(quantized.astype(np.float32) * scale - vector).max(), scale / 2 + 1e-6)
+
+    def test_zero_vector_has_unit_scale(self):
+        quantized, scale = quantize_int8(np.zeros(DIM, dtype=np.float32))
+        self.assertEqual(scale, 1.0)
+        self.assertFalse(quantized.any())
+
+
+class VectorStoreTest(unittest.TestCase):
+    def test_grows_past_initial_capacity(self):
+        store = _VectorStore(DIM)
+        rng = np.random.default_rng(2)
+        vectors = rng.standard_normal((200, DIM)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        for i, vector in enumerate(vectors):
+            store.add(f"k{i}", *quantize_int8(vector))
+
+        self.assertEqual(len(store), 200)
+        key, score = store.best_match(vectors[150])
+        self.assertEqual(key, "k150")
+        self.assertGreater(score, 0.99)
+
+
+class QueryCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "cache.sqlite")
+        self.embeddings = FakeEmbeddings({"parafrasi di domanda 80": ("domanda 80", 0.01)})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _cache(self, **kwargs):
+        cache = QueryCache(path=self.path, embeddings=self.embeddings, **kwargs)
+        self.addCleanup(cache.conn.close)
+        return cache
+
+    def test_exact_hit(self):
+        cache = self._cache()
+        cache.put("Quante righe ha Person?", "scope", "19972")
+        self.assertEqual(cache.get("Quante righe ha Person?", "scope"), "19972")
+        self.assertIsNone(cache.get("Quante righe ha Person?", "altro scope"))
+
+    def test_semantic_hit_after_store_growth(self):
+        cache = self._cache()
+        # Il primo miss carica la matrice dello scope: i put successivi la fanno crescere
+        self.assertIsNone(cache.get("domanda iniziale", "scope"))
+        for i in range(100):
+            cache.put(f"domanda {i}", "scope", f"risposta {i}")
+
+        self.assertEqual(len(cache._vectors["scope"]), 100)
+        self.assertEqual(cache.get("parafrasi di domanda 80", "scope"), "risposta 80")
+        self.assertIsNone(cache.get("domanda mai vista", "scope"))
+
+    def test_errors_are_never_cached(self):
+        cache = self._cache()
+        failures = [
+            "Errore: connessione rifiutata",
+            "Agent stopped due to iteration limit or time limit.",
+            "Errore: timeout di 30s superato per il tool sql_db_query.",
+            "",
+        ]
+        for i, response in enumerate(failures):
+            cache.put(f"domanda {i}", "scope", response)
+        cache.put_many([(f"altra domanda {i}", response) for i, response in enumerate(failures)], "scope")
+
+        count = cache.conn.execute("SELECT COUNT(*) FROM query_cache").fetchone()[0]
+        self.assertEqual(count, 0)
+        self.assertIsNone(cache.get("domanda 0", "scope"))
+
+    def test_expired_entries_are_ignored(self):
+        cache = self._cache(ttl_seconds=60)
+        cache.put("domanda 80", "scope", "risposta 80")
+
+        with mock.patch("query_cache.time.time", return_value=time.time() + 120):
+            self.assertIsNone(cache.get("domanda 80", "scope"))
+            self.assertIsNone(cache.get("parafrasi di domanda 80", "scope"))
+
+    def test_legacy_float32_rows_are_migrated(self):
+        # Cache creata prima della quantizzazione: niente colonna embedding_scale
+        conn = sqlite3.connect(self.path)
+        conn.execute("""
+            CREATE TABLE query_cache (
+                question_hash TEXT PRIMARY KEY,
+                scope TEXT,
+                embedding BLOB,
+                response TEXT,
+                ts REAL
+            )
+        """)
+        vector = np.asarray(self.embeddings.embed_query("domanda 80"), dtype=np.float32)
+        vector /= np.linalg.norm(vector)
+        conn.execute(
+            "INSERT INTO query_cache VALUES (?, ?, ?, ?, ?)",
+            (QueryCache._hash("domanda 80", "scope"), "scope", vector.tobytes(), "risposta 80", time.time())
+        )
+        conn.commit()
+        conn.close()
+
+        cache = self._cache()
+        self.assertEqual(cache.get("parafrasi di domanda 80", "scope"), "risposta 80")
+
+
+if __name__ == "__main__":
+    unittest.main()
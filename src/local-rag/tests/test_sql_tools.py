@@ -0,0 +1,45 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from langchain_community.utilities import SQLDatabase
+    from langchain_community.llms.fake import FakeListLLM
+    from sql_tools import (
+        TOOL_TIMEOUTS, TimeoutInfoSQLDatabaseTool, TimeoutQuerySQLDataBaseTool,
+        TimeoutSQLDatabaseToolkit,
+    )
+except ImportError:
+    SQLDatabase = None
+
+
+class _StubSQLDatabase(SQLDatabase or object):
+    """SQLDatabase senza connessione: basta per costruire i tool"""
+
+    def __init__(self):
+        pass
+
+    @property
+    def dialect(self):
+        return "mssql"
+
+    def get_usable_table_names(self):
+        return []
+
+
+@unittest.skipIf(SQLDatabase is None, "langchain-community non installato")
+class TimeoutSQLDatabaseToolkitTest(unittest.TestCase):
+    def test_query_and_schema_tools_are_wrapped(self):
+        toolkit = TimeoutSQLDatabaseToolkit(db=_StubSQLDatabase(), llm=FakeListLLM(responses=[""]))
+        tools = {tool.name: tool for tool in toolkit.get_tools()}
+
+        self.assertIsInstance(tools["sql_db_query"], TimeoutQuerySQLDataBaseTool)
+        self.assertIsInstance(tools["sql_db_schema"], TimeoutInfoSQLDatabaseTool)
+        self.assertEqual(tools["sql_db_query"].timeout, TOOL_TIMEOUTS["sql_db_query"])
+        self.assertEqual(tools["sql_db_schema"].timeout, TOOL_TIMEOUTS["sql_db_schema"])
+
+
+if __name__ == "__main__":
+    unittest.main()